@@ -1,37 +1,286 @@
 """LSP client implementation for connecting to language servers."""
 
 import asyncio
+import contextlib
 import json
 import logging
-from typing import Any, Callable, Dict, List, Optional
+import os
+import re
+import socket
+import tempfile
+from collections import deque
+from types import MappingProxyType
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
 from pathlib import Path
 
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:  # orjson is optional; fall back to the stdlib
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    _loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+_CONTENT_LENGTH_RE = re.compile(rb"Content-Length:[ \t]*(\d+)")
+
+# Request slots kept behind an unanswered request before it is parked aside
+_PENDING_SLOTS_MAX = 1024
+
+# Metals status/log text indicating the build import has finished
+_READY_RE = re.compile(r"indexing complete|indexed workspace|imported build", re.IGNORECASE)
+
+# Client capabilities sent with every initialize request (never mutated)
+_CAPABILITIES: Dict[str, Any] = {
+    "textDocument": {
+        "publishDiagnostics": {
+            "relatedInformation": True,
+            "tagSupport": {"valueSet": [1, 2]},
+            "codeDescriptionSupport": True,
+        },
+        "hover": {
+            "contentFormat": ["markdown", "plaintext"],
+        },
+        "definition": {
+            "linkSupport": True,
+        },
+    }
+}
+
+
+def _replace_file(path: str, data: bytes) -> None:
+    """Atomically replace path's contents, so readers see the old or new file whole.
+
+    Each write goes to its own temp file, so concurrent writers (e.g. two
+    clients sharing the /tmp file) can't interleave; the last rename wins.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".diagnostics-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+class _MessageProtocol(asyncio.BufferedProtocol):
+    """Frames LSP messages from server output read into a reusable buffer.
+
+    Attached to a socket transport, the event loop reads straight into
+    the buffer via get_buffer/buffer_updated. Output read some other way
+    can be passed to feed(). Parsed messages are put on a queue, with
+    None marking end of output.
+    """
+
+    def __init__(
+        self,
+        queue: asyncio.Queue,
+        bufsize: int,
+        max_message_size: int,
+        on_overflow: Callable[[], None],
+    ):
+        self._queue = queue
+        self._bufsize = bufsize
+        self._max_message_size = max_message_size
+        self._on_overflow = on_overflow
+        self._overflowed = False
+        self._buf = bytearray(bufsize)
+        self._read_pos = 0  # start of unconsumed data
+        self._write_pos = 0  # end of received data
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        needed = max(sizehint, self._bufsize)
+        if self._read_pos == self._write_pos:
+            self._read_pos = self._write_pos = 0
+            # Drained: give back memory a large frame made the buffer grow to
+            if len(self._buf) > 4 * needed:
+                self._buf = bytearray(needed)
+        if len(self._buf) - self._write_pos < needed:
+            # Move the partial message to the front, then grow if still short
+            if self._read_pos:
+                unread = self._write_pos - self._read_pos
+                self._buf[:unread] = self._buf[self._read_pos:self._write_pos]
+                self._read_pos = 0
+                self._write_pos = unread
+            shortfall = needed - (len(self._buf) - self._write_pos)
+            if shortfall > 0:
+                self._buf.extend(bytes(shortfall))
+        return memoryview(self._buf)[self._write_pos:]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        if self._overflowed:
+            # Discard anything still arriving before the server goes away
+            self._read_pos = self._write_pos = 0
+            return
+
+        self._write_pos += nbytes
+        buffer = self._buf
+
+        while True:
+            # Parse Content-Length header
+            header_end = buffer.find(b"\r\n\r\n", self._read_pos, self._write_pos)
+            if header_end == -1:
+                break
+
+            match = _CONTENT_LENGTH_RE.search(buffer, self._read_pos, header_end)
+            if match is None:
+                logger.error("No Content-Length header found")
+                self._read_pos = header_end + 4
+                continue
+
+            content_length = int(match.group(1))
+            if content_length > self._max_message_size:
+                self._overflow(f"Content-Length {content_length}")
+                return
+
+            # Check if we have the full message
+            message_start = header_end + 4
+            message_end = message_start + content_length
+
+            if self._write_pos < message_end:
+                break
+
+            # Parse straight from the buffer; the parser takes the raw
+            # bytes directly, so no intermediate str is built here
+            self._read_pos = message_end
+            try:
+                self._queue.put_nowait(_loads(buffer[message_start:message_end]))
+            except ValueError as e:
+                logger.error(f"Failed to parse JSON: {e}")
+
+        # Output with no usable framing must not accumulate without bound
+        if self._write_pos - self._read_pos > self._max_message_size:
+            self._overflow(f"{self._write_pos - self._read_pos} unframed bytes")
+
+    def _overflow(self, what: str) -> None:
+        logger.error(
+            f"LSP message exceeds {self._max_message_size} bytes ({what}), dropping connection"
+        )
+        self._overflowed = True
+        self._read_pos = self._write_pos = 0
+        self._on_overflow()
+
+    def feed(self, data: bytes) -> None:
+        """Frame output that was read outside the protocol."""
+        nbytes = len(data)
+        self.get_buffer(nbytes)[:nbytes] = data
+        self.buffer_updated(nbytes)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._queue.put_nowait(None)
+
 
 class LSPClient:
     """Client for communicating with LSP servers via stdio."""
 
-    def __init__(self, workspace_root: str):
+    def __init__(
+        self,
+        workspace_root: str,
+        read_bufsize: int = 65536,
+        max_message_size: int = 64 * 1024 * 1024,
+    ):
         self.workspace_root = Path(workspace_root).resolve()
+        self.read_bufsize = read_bufsize
+        self.max_message_size = max_message_size
         self.process: Optional[asyncio.subprocess.Process] = None
         self.initialized = False
+        self.closed = False  # set once the server's output ends; no further sends
         self.diagnostics: Dict[str, List[Dict[str, Any]]] = {}
+        self._diag_version = 0  # bumped on every publishDiagnostics
+        self._dirty_since_compile = True  # documents opened/changed since last compile
         self.request_id = 0
-        self.pending_requests: Dict[int, asyncio.Future] = {}
+        # Slot i holds the future for request id _pending_base + i + 1; finished
+        # slots are trimmed from the front so only the outstanding span is kept
+        self.pending_requests: Deque[Optional[asyncio.Future]] = deque()
+        self._pending_base = 0
+        # Long-unanswered requests moved out of the slots, by request id
+        self._stragglers: Dict[int, asyncio.Future] = {}
         self.notification_handlers: Dict[str, List[Callable]] = {}
         self._reader_task: Optional[asyncio.Task] = None
+        self._messages: asyncio.Queue = asyncio.Queue()
+        self._protocol = _MessageProtocol(
+            self._messages, read_bufsize, max_message_size, self._kill_server
+        )
+        self._stdout_transport: Optional[asyncio.BaseTransport] = None
+        self._stdout_task: Optional[asyncio.Task] = None
+        self._builtin_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            "window/logMessage": self._log_window_message,
+            "window/showMessage": self._log_show_message,
+            "metals/status": self._log_metals_status,
+            "textDocument/publishDiagnostics": self._handle_diagnostics,
+        }
+        # Running error/warning tallies, kept in step with self.diagnostics
+        self._error_count = 0
+        self._warning_count = 0
+        self._diag_entries: Dict[str, Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+        self._uri_filename: Dict[str, str] = {}
+        # Item counts for files whose latest publishDiagnostics was non-empty
+        self._diag_counts: Dict[str, int] = {}
+        self._change_envelopes: Dict[str, Dict[str, Any]] = {}
+        self._ready_event = asyncio.Event()
+        self.diagnostics_event = asyncio.Event()  # set on every publishDiagnostics
+        self._file_ready_events: Dict[str, asyncio.Event] = {}  # set on first publish per URI
+        self.ready_timeout = 10.0
+        self._diag_write_delay = 0.2
+        self._diag_dirty = False
+        self._diag_task: Optional[asyncio.Task] = None
+        # Workspace file first, then /tmp for backwards compatibility
+        self._diag_paths = (
+            str(self.workspace_root / ".lsp-bridge" / "diagnostics.json"),
+            "/tmp/lsp-bridge-diagnostics.json",
+        )
 
     async def start(self, command: List[str]) -> None:
         """Start the LSP server process."""
         logger.info(f"Starting LSP server: {' '.join(command)}")
-        self.process = await asyncio.create_subprocess_exec(
-            *command,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=str(self.workspace_root),
-        )
+
+        # Give the server a socket as stdout so the loop can read into our
+        # buffer directly; plain pipes only support copying data_received
+        try:
+            stdout_sock, child_stdout = socket.socketpair()
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Socket stdout unavailable, using a pipe: {e}")
+            stdout_sock = child_stdout = None
+
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=child_stdout or asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=str(self.workspace_root),
+                # Only the pipe fallback reads stdout through a StreamReader
+                # (the socket path goes straight to _MessageProtocol); raise its
+                # high-water mark so large payloads aren't throttled at 64 KiB
+                limit=1 << 20,
+            )
+        except BaseException:
+            if stdout_sock:
+                stdout_sock.close()
+            raise
+        finally:
+            if child_stdout:
+                child_stdout.close()
+
+        if stdout_sock:
+            self._stdout_transport, _ = await asyncio.get_running_loop().connect_accepted_socket(
+                lambda: self._protocol, stdout_sock
+            )
+        else:
+            self._stdout_task = asyncio.create_task(self._pump_stdout())
+
+        # Let outgoing messages queue in the transport: drain() only waits
+        # while the transport is paused, i.e. once the backlog passes 1 MiB
+        self.process.stdin.transport.set_write_buffer_limits(high=1 << 20)
 
         # Start reading responses
         self._reader_task = asyncio.create_task(self._read_responses())
@@ -44,21 +293,7 @@ class LSPClient:
         init_params = {
             "processId": None,
             "rootUri": self.workspace_root.as_uri(),
-            "capabilities": {
-                "textDocument": {
-                    "publishDiagnostics": {
-                        "relatedInformation": True,
-                        "tagSupport": {"valueSet": [1, 2]},
-                        "codeDescriptionSupport": True,
-                    },
-                    "hover": {
-                        "contentFormat": ["markdown", "plaintext"],
-                    },
-                    "definition": {
-                        "linkSupport": True,
-                    },
-                }
-            },
+            "capabilities": _CAPABILITIES,
             "workspaceFolders": [
                 {
                     "uri": self.workspace_root.as_uri(),
@@ -75,9 +310,12 @@ class LSPClient:
         self.initialized = True
 
         # For Metals: Don't trigger import manually - Metals does it automatically
-        # Just wait for Metals to complete its auto-import of Bloop
+        # Just wait for Metals to report that its auto-import of Bloop is done
         logger.info("Waiting for Metals to auto-import build...")
-        await asyncio.sleep(10)  # Give Metals time to import build
+        try:
+            await asyncio.wait_for(self._ready_event.wait(), timeout=self.ready_timeout)
+        except asyncio.TimeoutError:
+            logger.info("No readiness signal from server, continuing")
         logger.info("Metals initialization complete")
 
     def on_notification(self, method: str, handler: Callable) -> None:
@@ -86,10 +324,18 @@ class LSPClient:
             self.notification_handlers[method] = []
         self.notification_handlers[method].append(handler)
 
+    def _write_message(self, payload: Dict[str, Any]) -> None:
+        """Frame a JSON-RPC payload and hand header and body to the transport together."""
+        content = _dumps(payload)
+        header = b"Content-Length: %d\r\n\r\n" % len(content)
+        self.process.stdin.writelines((header, content))
+
     async def _send_request(self, method: str, params: Any) -> Any:
         """Send a JSON-RPC request and wait for response."""
         if not self.process or not self.process.stdin:
             raise RuntimeError("LSP server not started")
+        if self.closed:
+            raise RuntimeError("LSP server connection is closed")
 
         self.request_id += 1
         request_id = self.request_id
@@ -103,15 +349,14 @@ class LSPClient:
 
         # Create future for response
         future = asyncio.Future()
-        self.pending_requests[request_id] = future
+        self._trim_pending_requests()
+        self.pending_requests.append(future)
 
-        # Send request
-        content = json.dumps(request)
-        message = f"Content-Length: {len(content)}\r\n\r\n{content}"
-        self.process.stdin.write(message.encode("utf-8"))
-        await self.process.stdin.drain()
+        # Send request; no drain needed since awaiting the response yields
+        self._write_message(request)
 
-        logger.debug(f"Sent request {request_id}: {method}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sent request %d: %s", request_id, method)
 
         # Wait for response
         return await future
@@ -120,6 +365,8 @@ class LSPClient:
         """Send a JSON-RPC notification (no response expected)."""
         if not self.process or not self.process.stdin:
             raise RuntimeError("LSP server not started")
+        if self.closed:
+            raise RuntimeError("LSP server connection is closed")
 
         notification = {
             "jsonrpc": "2.0",
@@ -127,76 +374,95 @@ class LSPClient:
             "params": params,
         }
 
-        content = json.dumps(notification)
-        message = f"Content-Length: {len(content)}\r\n\r\n{content}"
-        self.process.stdin.write(message.encode("utf-8"))
+        self._write_message(notification)
         await self.process.stdin.drain()
 
-        logger.debug(f"Sent notification: {method}")
-
-    async def _read_responses(self) -> None:
-        """Read and process responses from the LSP server."""
-        if not self.process or not self.process.stdout:
-            return
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sent notification: %s", method)
 
-        buffer = b""
+    def _kill_server(self) -> None:
+        """Kill the server process, e.g. after it sent an oversized message."""
+        self._mark_closed(RuntimeError("LSP server connection dropped"))
+        if self.process and self.process.returncode is None:
+            self.process.kill()
 
-        while True:
-            try:
-                chunk = await self.process.stdout.read(4096)
+    async def _pump_stdout(self) -> None:
+        """Feed pipe output to the framer when no socket stdout is available."""
+        try:
+            while True:
+                chunk = await self.process.stdout.read(self.read_bufsize)
                 if not chunk:
                     break
+                self._protocol.feed(chunk)
+        except Exception as e:
+            logger.error(f"Error reading from LSP server: {e}")
+        finally:
+            self._protocol.connection_lost(None)
 
-                buffer += chunk
-
-                while True:
-                    # Parse Content-Length header
-                    if b"\r\n\r\n" not in buffer:
-                        break
-
-                    header_end = buffer.index(b"\r\n\r\n")
-                    headers = buffer[:header_end].decode("utf-8")
-
-                    content_length = None
-                    for line in headers.split("\r\n"):
-                        if line.startswith("Content-Length:"):
-                            content_length = int(line.split(":")[1].strip())
-                            break
-
-                    if content_length is None:
-                        logger.error("No Content-Length header found")
-                        buffer = buffer[header_end + 4:]
-                        continue
-
-                    # Check if we have the full message
-                    message_start = header_end + 4
-                    message_end = message_start + content_length
-
-                    if len(buffer) < message_end:
-                        break
-
-                    # Extract and parse message
-                    message_bytes = buffer[message_start:message_end]
-                    buffer = buffer[message_end:]
-
-                    try:
-                        message = json.loads(message_bytes.decode("utf-8"))
-                        logger.info(f"🔍 Received message: {list(message.keys())}")
-                        await self._handle_message(message)
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse JSON: {e}")
+    async def _read_responses(self) -> None:
+        """Process messages framed from the LSP server's output."""
+        while True:
+            message = await self._messages.get()
+            if message is None:
+                self._mark_closed(RuntimeError("LSP server closed its output"))
+                break
 
+            try:
+                logger.debug("Received message: %s", message.get("method") or message.get("id"))
+                await self._handle_message(message)
             except Exception as e:
-                logger.error(f"Error reading from LSP server: {e}")
-                break
+                logger.error(f"Error handling LSP message: {e}")
+
+    def _mark_closed(self, exc: Exception) -> None:
+        """Stop using the connection: fail outstanding requests, refuse new sends."""
+        self.closed = True
+        self.initialized = False
+        self._fail_pending_requests(exc)
+
+    def _fail_pending_requests(self, exc: Exception) -> None:
+        """Fail every outstanding request, e.g. once the server has gone away."""
+        for future in (*self.pending_requests, *self._stragglers.values()):
+            if future is not None and not future.done():
+                future.set_exception(exc)
+        self.pending_requests.clear()
+        self._stragglers.clear()
+        self._pending_base = self.request_id
+
+    def _trim_pending_requests(self) -> None:
+        """Drop answered or abandoned (e.g. cancelled) slots from the front.
+
+        An outstanding request at the front is parked in _stragglers once
+        too many slots queue up behind it, so the slots stay bounded even
+        if the server never answers it.
+        """
+        pending = self.pending_requests
+        while pending:
+            head = pending[0]
+            if head is not None and not head.done():
+                if len(pending) <= _PENDING_SLOTS_MAX:
+                    break
+                request_id = self._pending_base + 1
+                self._stragglers[request_id] = head
+                head.add_done_callback(lambda _, rid=request_id: self._stragglers.pop(rid, None))
+            pending.popleft()
+            self._pending_base += 1
 
     async def _handle_message(self, message: Dict[str, Any]) -> None:
         """Handle a message from the LSP server."""
         if "id" in message:
             # This is a response to a request
             request_id = message["id"]
-            if request_id in self.pending_requests:
-                future = self.pending_requests.pop(request_id)
+            slot = request_id - self._pending_base - 1 if isinstance(request_id, int) else -1
+            if 0 <= slot < len(self.pending_requests):
+                future = self.pending_requests[slot]
+                self.pending_requests[slot] = None
+                self._trim_pending_requests()
+            else:
+                future = self._stragglers.pop(request_id, None)
+            if future is not None:
+                if future.done():
+                    # The caller gave up waiting (e.g. timed out)
+                    return
                 if "error" in message:
                     future.set_exception(
                         Exception(f"LSP error: {message['error']}")
@@ -208,32 +474,12 @@ class LSPClient:
             method = message["method"]
             params = message.get("params", {})
 
-            logger.info(f"📨 Received notification: {method}")
-
-            # Log important Metals notifications
-            if method == "window/logMessage":
-                message = params.get("message", "")
-                logger.info(f"  Metals: {message}")
-            elif method == "window/showMessage":
-                message = params.get("message", "")
-                logger.info(f"  Metals message: {message}")
-            elif method == "metals/status":
-                logger.info(f"  Metals status: {params}")
-
-            # Handle diagnostics specially
-            if method == "textDocument/publishDiagnostics":
-                uri = params.get("uri", "")
-                diagnostics = params.get("diagnostics", [])
-                self.diagnostics[uri] = diagnostics
-                logger.info(
-                    f"📊 Updated diagnostics for {uri}: {len(diagnostics)} items"
-                )
-                if diagnostics:
-                    for diag in diagnostics[:3]:  # Log first 3
-                        logger.info(f"  - {diag.get('severity')}: {diag.get('message')}")
-
-                # Write diagnostics to temp file for hook integration
-                self._write_diagnostics_file()
+            logger.debug("Received notification: %s", method)
+
+            # Built-in handling for Metals logging and diagnostics
+            builtin = self._builtin_handlers.get(method)
+            if builtin:
+                builtin(params)
 
             # Call registered handlers
             if method in self.notification_handlers:
@@ -243,8 +489,52 @@ class LSPClient:
                     except Exception as e:
                         logger.error(f"Error in notification handler: {e}")
 
+    def _log_window_message(self, params: Dict[str, Any]) -> None:
+        """Log a window/logMessage notification and watch for build readiness."""
+        message = params.get("message", "")
+        logger.info(f"  Metals: {message}")
+        if _READY_RE.search(message):
+            self._ready_event.set()
+
+    def _log_show_message(self, params: Dict[str, Any]) -> None:
+        """Log a window/showMessage notification."""
+        logger.info(f"  Metals message: {params.get('message', '')}")
+
+    def _log_metals_status(self, params: Dict[str, Any]) -> None:
+        """Log a metals/status notification and watch for build readiness."""
+        logger.info(f"  Metals status: {params}")
+        if _READY_RE.search(params.get("text", "")):
+            self._ready_event.set()
+
+    def _handle_diagnostics(self, params: Dict[str, Any]) -> None:
+        """Store diagnostics published for a file."""
+        uri = params.get("uri", "")
+        diagnostics = params.get("diagnostics", [])
+        self.diagnostics[uri] = diagnostics
+        self._diag_version += 1
+        if diagnostics:
+            self._diag_counts[uri] = len(diagnostics)
+        else:
+            self._diag_counts.pop(uri, None)
+        self._update_diagnostic_counts(uri, diagnostics)
+        self.diagnostics_event.set()
+        ready = self._file_ready_events.get(uri)
+        if ready is None:
+            self._file_ready_events[uri] = ready = asyncio.Event()
+        ready.set()
+        logger.info(
+            f"📊 Updated diagnostics for {uri}: {len(diagnostics)} items"
+        )
+        if diagnostics:
+            for diag in diagnostics[:3]:  # Log first 3
+                logger.info(f"  - {diag.get('severity')}: {diag.get('message')}")
+
+        # Write diagnostics to temp file for hook integration
+        self._schedule_diagnostics_write()
+
     async def did_open(self, uri: str, language_id: str, text: str) -> None:
         """Notify server that a document was opened."""
+        self._dirty_since_compile = True
         await self._send_notification(
             "textDocument/didOpen",
             {
@@ -259,12 +549,31 @@ class LSPClient:
 
     async def did_change(self, uri: str, text: str, version: int) -> None:
         """Notify server that a document changed."""
-        await self._send_notification(
-            "textDocument/didChange",
-            {
+        self._dirty_since_compile = True
+        # Reuse one params dict per URI; it is serialized before any await,
+        # so patching it in place for the next change is safe
+        params = self._change_envelopes.get(uri)
+        if params is None:
+            params = {
                 "textDocument": {"uri": uri, "version": version},
                 "contentChanges": [{"text": text}],
-            },
+            }
+            self._change_envelopes[uri] = params
+        else:
+            params["textDocument"]["version"] = version
+            params["contentChanges"][0]["text"] = text
+        try:
+            await self._send_notification("textDocument/didChange", params)
+        finally:
+            # Don't keep the document text alive between changes
+            params["contentChanges"][0]["text"] = ""
+
+    async def did_close(self, uri: str) -> None:
+        """Notify server that a document was closed."""
+        self._change_envelopes.pop(uri, None)
+        await self._send_notification(
+            "textDocument/didClose",
+            {"textDocument": {"uri": uri}},
         )
 
     async def did_save(self, uri: str) -> None:
@@ -328,47 +637,146 @@ class LSPClient:
             logger.error(f"Definition request failed: {e}")
             return None
 
+    @property
+    def error_count(self) -> int:
+        """Errors across all files' latest diagnostics."""
+        return self._error_count
+
+    @property
+    def warning_count(self) -> int:
+        """Warnings across all files' latest diagnostics."""
+        return self._warning_count
+
+    @property
+    def diagnostic_counts(self) -> Mapping[str, int]:
+        """Diagnostic counts by URI, for files that currently have any."""
+        return MappingProxyType(self._diag_counts)
+
+    @property
+    def diagnostics_version(self) -> int:
+        """Counter bumped on every publishDiagnostics."""
+        return self._diag_version
+
+    @property
+    def dirty_since_compile(self) -> bool:
+        """Whether documents were opened or changed since mark_compiled()."""
+        return self._dirty_since_compile
+
+    def mark_compiled(self) -> None:
+        """Record that a compile was requested covering all current changes."""
+        self._dirty_since_compile = False
+
     def get_diagnostics(self, uri: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
         """Get diagnostics for a file or all files."""
         if uri:
             return {uri: self.diagnostics.get(uri, [])}
         return self.diagnostics.copy()
 
-    def _write_diagnostics_file(self) -> None:
-        """Write current diagnostics to workspace .lsp-bridge directory."""
+    async def wait_for_diagnostics_quiescence(self, idle_ms: int = 500) -> None:
+        """Wait for publishDiagnostics to arrive and then go quiet.
+
+        Returns once at least one publish has been seen and no further
+        publish arrives within idle_ms. Callers bound the total wait.
+        """
+        await self.diagnostics_event.wait()
+        while True:
+            self.diagnostics_event.clear()
+            try:
+                await asyncio.wait_for(self.diagnostics_event.wait(), timeout=idle_ms / 1000)
+            except asyncio.TimeoutError:
+                return
+
+    async def wait_for_file_ready(self, uri: str, timeout: float) -> bool:
+        """Wait until the server has published diagnostics for uri.
+
+        Returns False if none arrived within timeout seconds.
+        """
+        ready = self._file_ready_events.setdefault(uri, asyncio.Event())
         try:
-            # Count errors and warnings
-            errors = []
-            warnings = []
-            for uri, diags in self.diagnostics.items():
-                file_path = uri.replace("file://", "")
-                file_name = Path(file_path).name
-                for diag in diags:
-                    severity = diag.get("severity", 3)
-                    line = diag.get("range", {}).get("start", {}).get("line", 0) + 1
-                    msg = diag.get("message", "")
-                    entry = {"file": file_name, "line": line, "message": msg}
-                    if severity == 1:
-                        errors.append(entry)
-                    elif severity == 2:
-                        warnings.append(entry)
-
-            output = {
-                "error_count": len(errors),
-                "warning_count": len(warnings),
-                "errors": errors[:5],  # Limit to first 5
-                "warnings": warnings[:3],  # Limit to first 3
-            }
+            await asyncio.wait_for(ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _schedule_diagnostics_write(self) -> None:
+        """Coalesce diagnostics file updates into one write per burst."""
+        self._diag_dirty = True
+        if self._diag_task is None:
+            self._diag_task = asyncio.create_task(self._diagnostics_writer())
+
+    async def _diagnostics_writer(self) -> None:
+        """Write the diagnostics file once publishDiagnostics bursts settle."""
+        try:
+            while self._diag_dirty:
+                await asyncio.sleep(self._diag_write_delay)
+                self._diag_dirty = False
+                # Summarize on the loop thread; only the file I/O is offloaded
+                output = self._diagnostics_summary()
+                await asyncio.to_thread(self._write_diagnostics_file, output)
+        finally:
+            self._diag_task = None
+
+    def _update_diagnostic_counts(self, uri: str, diagnostics: List[Dict[str, Any]]) -> None:
+        """Replace a file's contribution to the error/warning tallies."""
+        old_errors, old_warnings = self._diag_entries.get(uri, ((), ()))
+        self._error_count -= len(old_errors)
+        self._warning_count -= len(old_warnings)
+
+        file_name = self._uri_filename.get(uri)
+        if file_name is None:
+            file_name = Path(uri[7:] if uri.startswith("file://") else uri).name
+            self._uri_filename[uri] = file_name
+
+        errors = []
+        warnings = []
+        for diag in diagnostics:
+            severity = diag.get("severity", 3)
+            if severity != 1 and severity != 2:
+                continue
+            line = diag.get("range", {}).get("start", {}).get("line", 0) + 1
+            entry = {"file": file_name, "line": line, "message": diag.get("message", "")}
+            if severity == 1:
+                errors.append(entry)
+            else:
+                warnings.append(entry)
+
+        self._error_count += len(errors)
+        self._warning_count += len(warnings)
+        if errors or warnings:
+            self._diag_entries[uri] = (errors, warnings)
+        else:
+            self._diag_entries.pop(uri, None)
+
+    def _diagnostics_summary(self) -> Dict[str, Any]:
+        """Summarize current diagnostics for the hook integration file."""
+        # Take the first 5 errors and first 3 warnings, stopping early
+        errors: List[Dict[str, Any]] = []
+        warnings: List[Dict[str, Any]] = []
+        for uri in self.diagnostics:
+            entries = self._diag_entries.get(uri)
+            if entries is None:
+                continue
+            file_errors, file_warnings = entries
+            if len(errors) < 5:
+                errors.extend(file_errors[:5 - len(errors)])
+            if len(warnings) < 3:
+                warnings.extend(file_warnings[:3 - len(warnings)])
+            if len(errors) >= 5 and len(warnings) >= 3:
+                break
 
-            # Write to workspace .lsp-bridge directory
-            lsp_dir = self.workspace_root / ".lsp-bridge"
-            lsp_dir.mkdir(exist_ok=True)
-            with open(lsp_dir / "diagnostics.json", "w") as f:
-                json.dump(output, f)
+        return {
+            "error_count": self._error_count,
+            "warning_count": self._warning_count,
+            "errors": errors,
+            "warnings": warnings,
+        }
 
-            # Also write to /tmp for backwards compatibility
-            with open("/tmp/lsp-bridge-diagnostics.json", "w") as f:
-                json.dump(output, f)
+    def _write_diagnostics_file(self, output: Dict[str, Any]) -> None:
+        """Write a diagnostics summary to workspace .lsp-bridge directory."""
+        try:
+            payload = _dumps(output)
+            for path in self._diag_paths:
+                _replace_file(path, payload)
         except Exception as e:
             logger.error(f"Failed to write diagnostics file: {e}")
 
@@ -382,8 +790,10 @@ class LSPClient:
     async def shutdown(self) -> None:
         """Shutdown the LSP server."""
         if self.initialized:
-            await self._send_request("shutdown", None)
-            await self._send_notification("exit", None)
+            # The server may go away mid-handshake; carry on tearing down
+            with contextlib.suppress(RuntimeError):
+                await self._send_request("shutdown", None)
+                await self._send_notification("exit", None)
 
         if self._reader_task:
             self._reader_task.cancel()
@@ -392,6 +802,15 @@ class LSPClient:
             except asyncio.CancelledError:
                 pass
 
+        if self._stdout_task:
+            self._stdout_task.cancel()
+        if self._stdout_transport:
+            self._stdout_transport.close()
+
+        # Flush any diagnostics write still waiting out its debounce window
+        if self._diag_task:
+            await self._diag_task
+
         if self.process:
             try:
                 await asyncio.wait_for(self.process.wait(), timeout=5.0)
@@ -1,13 +1,25 @@
 """MCP server that bridges to LSP servers."""
 
 import asyncio
+import atexit
+import contextlib
+import io
 import json
 import logging
-import subprocess
+import logging.handlers
+import os
+import queue
+import re
+import stat
 import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import unquote
 
+import anyio
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import (
@@ -20,18 +32,106 @@ from mcp.types import (
 
 from .lsp_client import LSPClient
 
-# Configure logging
+
+@dataclass(slots=True)
+class FormattedDiag:
+    """A diagnostic as reported to MCP clients."""
+
+    severity: str
+    line: int
+    character: int
+    message: str
+    source: str
+    code: Any
+
+
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> str:
+        """Serialize obj as indented JSON text."""
+        return orjson.dumps(
+            obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_DATACLASS
+        ).decode()
+except ImportError:  # orjson is optional; fall back to the stdlib
+    def _json_default(obj: Any) -> Any:
+        """Encode FormattedDiag rows, which the stdlib encoder can't handle."""
+        if isinstance(obj, FormattedDiag):
+            return {name: getattr(obj, name) for name in FormattedDiag.__slots__}
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def _dumps(obj: Any) -> str:
+        """Serialize obj as indented JSON text."""
+        return json.dumps(obj, indent=2, default=_json_default)
+
+try:
+    from asyncinotify import Inotify, Mask
+except ImportError:  # optional, Linux only; fall back to polling
+    Inotify = None
+
+try:
+    import uvloop
+except ImportError:  # optional; use the default asyncio event loop
+    uvloop = None
+
+# Configure logging: callers only enqueue records; a listener thread does the I/O
+_log_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+_log_handlers = [logging.FileHandler("/tmp/lsp-bridge-mcp.log"), logging.StreamHandler()]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("/tmp/lsp-bridge-mcp.log"), logging.StreamHandler()],
+    format="%(message)s",  # the listener's handlers apply the real format
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
 )
 logger = logging.getLogger(__name__)
 
+# Upper bound on concurrent file reads/didOpen notifications
+_OPEN_CONCURRENCY = 32
+# Rescan a workspace's source tree at least this often (seconds)
+_SCALA_FILES_TTL = 300.0
+# Reuse an unchanged workspace's last compile for this long (seconds); edits
+# made on disk without a didChange are picked up once it expires
+_COMPILE_REUSE_SECONDS = 30.0
+# Minimum interval between workspace auto-detection scans (seconds)
+_AUTODETECT_BACKOFF = 30.0
+# Unix socket hooks can write changed file paths to, one per line
+_NOTIFY_SOCKET = "/tmp/lsp-bridge-notify.sock"
+# Quiet period before acting on a hook notification for a file (seconds)
+_NOTIFY_DEBOUNCE = 0.05
+# Bytes stdin's text layer requests per read, so large MCP messages take fewer read() calls
+_STDIN_CHUNK_SIZE = 1 << 20
+# Maximum number of hook-notified paths whose resolution is remembered
+_RESOLVE_CACHE_SIZE = 1024
+# Maximum number of URIs whose didChange version is tracked; older ones are closed
+_FILE_VERSIONS_SIZE = 10_000
+# How long auto-detection trusts a candidate directory's probe result (seconds)
+_SCALA_ROOT_TTL = 30.0
+# Workspace diagnostics spanning more files than this are returned in chunks
+_CHUNK_FILES_THRESHOLD = 50
+# Files marking a directory as an sbt or Mill project root
+_BUILD_FILES = frozenset({"build.sbt", "build.sc"})
+# Extensions of hook-notified files forwarded to Metals (a tuple, for str.endswith)
+_WATCHED_EXTS = (".scala", ".sbt", ".sc", ".java")
+# LSP languageId for each watched extension, used when opening a notified file
+_LANGUAGE_IDS = {".scala": "scala", ".sbt": "scala", ".sc": "scala", ".java": "java"}
+# lsp://<workspace>/diagnostics/<all|file path>
+_URI_RE = re.compile(r"^lsp://([^/]+)/diagnostics/(.+)$")
+# LSP DiagnosticSeverity names by severity value; anything else (incl. null) is UNKNOWN
+_SEV_NAMES = {1: "ERROR", 2: "WARNING", 3: "INFO", 4: "HINT"}
+
 
 LSP_BRIDGE_INSTRUCTIONS = """
 NEVER run `sbt compile` or `sbt test:compile` to check for Scala compilation errors. ALWAYS use LSP:
 
+  ensure_compiled_and_get_diagnostics workspace="metals" workspace_root="/path/to/project"
+
+This compiles and returns diagnostics in one call. The two-step form still works:
+
 1. trigger_compilation workspace="metals" workspace_root="/path/to/project"
 2. get_diagnostics workspace="metals"
 
@@ -59,16 +159,133 @@ These are faster and more accurate than reading/searching files.
 """
 
 
+def _uri_to_path(uri: str) -> str:
+    """Convert a file:// URI to a plain, percent-decoded path."""
+    return unquote(uri.removeprefix("file://"))
+
+
+def _walk_scala(root: str) -> Iterator[str]:
+    """Yield paths of .scala files under root, skipping hidden and target dirs.
+
+    Directory symlinks aren't followed, so paths under a resolved root are
+    already canonical; only symlinked files need resolving.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith(".") and entry.name != "target":
+                            stack.append(entry.path)
+                    elif entry.name.endswith(".scala"):
+                        yield os.path.realpath(entry.path) if entry.is_symlink() else entry.path
+        except OSError:
+            pass
+
+
+def _scan_dir(path: str) -> Tuple[Set[str], List[str]]:
+    """Return the entry names and non-hidden subdirectory paths of path in one pass."""
+    names: Set[str] = set()
+    subdirs: List[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                names.add(entry.name)
+                # is_dir() uses the entry's d_type; only symlinks cost a stat
+                if not entry.name.startswith(".") and entry.is_dir():
+                    subdirs.append(entry.path)
+    except OSError:
+        pass
+    return names, subdirs
+
+
+def _has_build_file(path: str) -> bool:
+    """Return True if path contains an sbt or Mill build definition."""
+    return not _BUILD_FILES.isdisjoint(_scan_dir(path)[0])
+
+
+async def _probe_scala_root(path: Path) -> Optional[str]:
+    """Return path, or its first subdirectory, if it looks like a Scala project."""
+    names, subdirs = await asyncio.to_thread(_scan_dir, str(path))
+    if not _BUILD_FILES.isdisjoint(names):
+        return str(path)
+    hits = await asyncio.gather(*(asyncio.to_thread(_has_build_file, d) for d in subdirs))
+    for subdir, hit in zip(subdirs, hits):
+        if hit:
+            return subdir
+    return None
+
+
+def _resources_for_workspace(workspace: str, client: LSPClient) -> Iterator[Resource]:
+    """Yield the diagnostic resources exposed for one workspace."""
+    yield Resource(
+        uri=f"lsp://{workspace}/diagnostics/all",
+        name=f"All Diagnostics ({workspace})",
+        mimeType="application/json",
+        description=f"All compilation errors and warnings for {workspace}",
+    )
+
+    # One resource per file with diagnostics
+    for file_uri, count in client.diagnostic_counts.items():
+        file_path = _uri_to_path(file_uri)
+        yield Resource(
+            # Keep the path percent-encoded so read_resource can rebuild the URI
+            uri=f"lsp://{workspace}/diagnostics/{file_uri.removeprefix('file://')}",
+            name=f"Diagnostics: {Path(file_path).name}",
+            mimeType="application/json",
+            description=f"{count} diagnostic(s) in {file_path}",
+        )
+
+
 class LSPBridgeServer:
     """MCP server that connects to LSP servers."""
 
     def __init__(self):
         self.server = Server("lsp-bridge", instructions=LSP_BRIDGE_INSTRUCTIONS.strip())
         self.lsp_clients: Dict[str, LSPClient] = {}
+        self._start_locks: Dict[str, asyncio.Lock] = {}  # workspace -> held while starting
         self.config: Dict[str, Any] = {}
+        self._pending_config: Optional[Dict[str, Any]] = None  # applied by run() instead of a config file
         self.opened_files: Dict[str, set] = {}  # workspace -> set of opened file URIs
-        self.file_versions: Dict[str, int] = {}  # uri -> version for didChange
+        self._opening: Dict[str, asyncio.Future] = {}  # uri -> resolved once its didOpen is sent
+        # uri -> version for didChange, least recently changed first
+        self.file_versions: "OrderedDict[str, int]" = OrderedDict()
+        # notified path -> (resolved path, uri, workspace), least recently used first
+        self._resolve_cache: "OrderedDict[str, Tuple[Path, str, str]]" = OrderedDict()
+        # Path components -> nested nodes; a node's None key names the workspace rooted there
+        self._workspace_trie: Dict[Any, Any] = {}
+        self._read_sem = asyncio.Semaphore(8)  # bounds concurrent notified-file reads
+        self._pending_notifications: Dict[str, asyncio.TimerHandle] = {}
+        self._notify_tasks: Set[asyncio.Task] = set()
+        self._sent_hashes: Dict[str, int] = {}  # uri -> hash of the text last sent
+        # workspace -> [(path, uri)] of its Scala sources, and when it was scanned
+        self._workspace_scala_files: Dict[str, List[Tuple[Path, str]]] = {}
+        self._scala_files_scanned_at: Dict[str, float] = {}
         self._notify_watcher_task: Optional[asyncio.Task] = None
+        self._notify_socket_id: Optional[Tuple[int, int]] = None  # (st_dev, st_ino) we bound
+        self._autodetect_attempted_at = float("-inf")  # monotonic time of last scan
+        self._autodetect_lock = asyncio.Lock()  # held while scanning
+        # candidate dir -> (expires at, detected project root or None)
+        self._scala_root_cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        # workspace -> (diagnostics version, formatted, serialized chunks) for all files
+        self._format_cache: Dict[str, Tuple[int, Dict[str, Any], List[str]]] = {}
+        # workspace -> diagnostics version last returned by get_diagnostics
+        self._last_returned_version: Dict[str, int] = {}
+        self._last_compile_at: Dict[str, float] = {}  # workspace -> monotonic time
+        # Tool name -> handler coroutine, used by call_tool
+        self._tool_handlers: Dict[
+            str, Callable[[Dict[str, Any]], Awaitable[List[TextContent]]]
+        ] = {
+            "list_workspaces": self._tool_list_workspaces,
+            "get_diagnostics": self._tool_get_diagnostics,
+            "ensure_compiled_and_get_diagnostics": self._tool_ensure_compiled_and_get_diagnostics,
+            "trigger_compilation": self._tool_trigger_compilation,
+            "get_status": self._tool_get_status,
+            "get_hover": self._tool_get_hover,
+            "get_definition": self._tool_get_definition,
+        }
         self._setup_handlers()
 
     def _setup_handlers(self) -> None:
@@ -77,34 +294,12 @@ class LSPBridgeServer:
         @self.server.list_resources()
         async def list_resources() -> List[Resource]:
             """List available diagnostic resources."""
-            resources = []
-
-            for workspace, client in self.lsp_clients.items():
-                # Add resource for all diagnostics
-                resources.append(
-                    Resource(
-                        uri=f"lsp://{workspace}/diagnostics/all",
-                        name=f"All Diagnostics ({workspace})",
-                        mimeType="application/json",
-                        description=f"All compilation errors and warnings for {workspace}",
-                    )
-                )
-
-                # Add resources for each file with diagnostics
-                diagnostics = client.get_diagnostics()
-                for file_uri, diags in diagnostics.items():
-                    if diags:
-                        file_path = file_uri.replace("file://", "")
-                        resources.append(
-                            Resource(
-                                uri=f"lsp://{workspace}/diagnostics/{file_path}",
-                                name=f"Diagnostics: {Path(file_path).name}",
-                                mimeType="application/json",
-                                description=f"{len(diags)} diagnostic(s) in {file_path}",
-                            )
-                        )
-
-            return resources
+            return [
+                resource
+                for workspace, client in tuple(self.lsp_clients.items())
+                if client.initialized
+                for resource in _resources_for_workspace(workspace, client)
+            ]
 
         @self.server.read_resource()
         async def read_resource(uri: str) -> str:
@@ -117,11 +312,11 @@ class LSPBridgeServer:
             if not uri.startswith("lsp://"):
                 raise ValueError(f"Invalid URI scheme: {uri}")
 
-            parts = uri.replace("lsp://", "").split("/diagnostics/", 1)
-            if len(parts) != 2:
+            m = _URI_RE.match(uri)
+            if not m:
                 raise ValueError(f"Invalid URI format: {uri}")
 
-            workspace, path = parts
+            workspace, path = m.group(1), m.group(2)
 
             if workspace not in self.lsp_clients:
                 raise ValueError(f"Unknown workspace: {workspace}")
@@ -130,13 +325,12 @@ class LSPBridgeServer:
 
             if path == "all":
                 # Return all diagnostics
-                diagnostics = client.get_diagnostics()
-                return json.dumps(self._format_diagnostics(diagnostics), indent=2)
+                return self._diagnostics_document(workspace)
             else:
                 # Return diagnostics for specific file
                 file_uri = f"file://{path}"
                 diagnostics = client.get_diagnostics(file_uri)
-                return json.dumps(self._format_diagnostics(diagnostics), indent=2)
+                return _dumps(self._format_diagnostics(diagnostics))
 
         @self.server.list_tools()
         async def list_tools() -> List[Tool]:
@@ -164,6 +358,28 @@ class LSPBridgeServer:
                         "required": ["workspace"],
                     },
                 ),
+                Tool(
+                    name="ensure_compiled_and_get_diagnostics",
+                    description="Compile the workspace and return its diagnostics in a single call (connects the workspace first if needed)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "workspace": {
+                                "type": "string",
+                                "description": "Workspace name (e.g., 'metals')",
+                            },
+                            "file_path": {
+                                "type": "string",
+                                "description": "Optional: specific file path to get diagnostics for",
+                            },
+                            "workspace_root": {
+                                "type": "string",
+                                "description": "Optional: absolute path to workspace root (e.g., '/path/to/project'). If provided and workspace not connected, will lazily connect.",
+                            },
+                        },
+                        "required": ["workspace"],
+                    },
+                ),
                 Tool(
                     name="trigger_compilation",
                     description="Trigger compilation in the LSP server (if supported)",
@@ -267,340 +483,10 @@ class LSPBridgeServer:
             """Handle tool calls."""
             logger.info(f"Tool called: {name} with args: {arguments}")
 
-            if name == "list_workspaces":
-                workspace_root = arguments.get("workspace_root")
-
-                # If workspace_root provided, connect to it
-                if workspace_root:
-                    error = await self._ensure_workspace_connected("metals", workspace_root)
-                    if error:
-                        return [TextContent(type="text", text=error)]
-                # Otherwise auto-detect on first call if no workspaces
-                elif not self.lsp_clients:
-                    logger.info("No workspaces connected, attempting auto-detection...")
-                    await self.auto_detect_workspace()
-
-                logger.info(f"Current lsp_clients: {self.lsp_clients}")
-                workspaces = list(self.lsp_clients.keys())
-                logger.info(f"Returning workspaces: {workspaces}")
-                return [
-                    TextContent(
-                        type="text",
-                        text=json.dumps(
-                            {
-                                "workspaces": workspaces,
-                                "count": len(workspaces),
-                            },
-                            indent=2,
-                        ),
-                    )
-                ]
-
-            elif name == "get_diagnostics":
-                workspace = arguments.get("workspace")
-                file_path = arguments.get("file_path")
-                workspace_root = arguments.get("workspace_root")
-
-                # Ensure workspace is connected (lazy connect if workspace_root provided)
-                error = await self._ensure_workspace_connected(workspace, workspace_root)
-                if error:
-                    return [TextContent(type="text", text=error)]
-
-                client = self.lsp_clients[workspace]
-
-                # Open all Scala files in workspace if not already opened
-                await self._ensure_files_opened(client, workspace)
-
-                # Trigger Metals to compile the workspace
-                try:
-                    if workspace == "metals":
-                        logger.info("Triggering Metals compilation...")
-                        await client.execute_command("metals.compile-cascade")
-                        logger.info("Compilation triggered, waiting for diagnostics...")
-                except Exception as e:
-                    logger.warning(f"Failed to trigger compilation: {e}")
-
-                # Wait longer for Metals to analyze files (especially on first call)
-                # Metals needs time to connect to Bloop and analyze files
-                await asyncio.sleep(8)
-
-                if file_path:
-                    file_uri = Path(file_path).resolve().as_uri()
-                    diagnostics = client.get_diagnostics(file_uri)
-                else:
-                    diagnostics = client.get_diagnostics()
-
-                formatted = self._format_diagnostics(diagnostics)
-
-                return [
-                    TextContent(
-                        type="text",
-                        text=json.dumps(formatted, indent=2),
-                    )
-                ]
-
-            elif name == "trigger_compilation":
-                workspace = arguments.get("workspace")
-                workspace_root = arguments.get("workspace_root")
-
-                # Ensure workspace is connected (lazy connect if workspace_root provided)
-                error = await self._ensure_workspace_connected(workspace, workspace_root)
-                if error:
-                    return [TextContent(type="text", text=error)]
-
-                client = self.lsp_clients[workspace]
-
-                try:
-                    # Metals-specific: trigger compilation
-                    if workspace == "metals":
-                        result = await client.execute_command("metals.compile-cascade")
-                        return [
-                            TextContent(
-                                type="text",
-                                text=f"Compilation triggered. Result: {json.dumps(result, indent=2)}",
-                            )
-                        ]
-                    else:
-                        return [
-                            TextContent(
-                                type="text",
-                                text=f"Compilation trigger not yet implemented for {workspace}",
-                            )
-                        ]
-                except Exception as e:
-                    return [
-                        TextContent(
-                            type="text",
-                            text=f"Error triggering compilation: {str(e)}",
-                        )
-                    ]
-
-            elif name == "get_status":
-                workspace = arguments.get("workspace")
-
-                if workspace:
-                    if workspace not in self.lsp_clients:
-                        return [
-                            TextContent(
-                                type="text",
-                                text=f"Error: Unknown workspace '{workspace}'",
-                            )
-                        ]
-
-                    client = self.lsp_clients[workspace]
-                    diagnostics = client.get_diagnostics()
-
-                    error_count = sum(
-                        1
-                        for diags in diagnostics.values()
-                        for d in diags
-                        if d.get("severity") == 1
-                    )
-                    warning_count = sum(
-                        1
-                        for diags in diagnostics.values()
-                        for d in diags
-                        if d.get("severity") == 2
-                    )
-
-                    status = {
-                        "workspace": workspace,
-                        "initialized": client.initialized,
-                        "files_with_diagnostics": len(diagnostics),
-                        "total_errors": error_count,
-                        "total_warnings": warning_count,
-                    }
-                else:
-                    # All workspaces
-                    status = {}
-                    for ws_name, client in self.lsp_clients.items():
-                        diagnostics = client.get_diagnostics()
-                        error_count = sum(
-                            1
-                            for diags in diagnostics.values()
-                            for d in diags
-                            if d.get("severity") == 1
-                        )
-                        warning_count = sum(
-                            1
-                            for diags in diagnostics.values()
-                            for d in diags
-                            if d.get("severity") == 2
-                        )
-
-                        status[ws_name] = {
-                            "initialized": client.initialized,
-                            "files_with_diagnostics": len(diagnostics),
-                            "total_errors": error_count,
-                            "total_warnings": warning_count,
-                        }
-
-                return [
-                    TextContent(
-                        type="text",
-                        text=json.dumps(status, indent=2),
-                    )
-                ]
-
-            elif name == "get_hover":
-                workspace = arguments.get("workspace")
-                file_path = arguments.get("file_path")
-                line = arguments.get("line")
-                character = arguments.get("character")
-
-                if not all([workspace, file_path, line is not None, character is not None]):
-                    return [
-                        TextContent(
-                            type="text",
-                            text="Error: workspace, file_path, line, and character are required",
-                        )
-                    ]
-
-                # Auto-detect on first call if no workspaces
-                if not self.lsp_clients:
-                    logger.info("No workspaces connected, attempting auto-detection...")
-                    await self.auto_detect_workspace()
-
-                if workspace not in self.lsp_clients:
-                    return [
-                        TextContent(
-                            type="text",
-                            text=f"Error: Unknown workspace '{workspace}'. Available: {list(self.lsp_clients.keys())}",
-                        )
-                    ]
-
-                client = self.lsp_clients[workspace]
-
-                # Ensure file is opened in LSP
-                path = Path(file_path).resolve()
-                uri = path.as_uri()
-
-                if workspace not in self.opened_files:
-                    self.opened_files[workspace] = set()
-
-                if uri not in self.opened_files[workspace]:
-                    try:
-                        content = path.read_text()
-                        await client.did_open(uri, "scala", content)
-                        self.opened_files[workspace].add(uri)
-                        logger.info(f"Opened file for hover: {path.name}")
-                        # Give Metals a moment to analyze the file
-                        await asyncio.sleep(2)
-                    except Exception as e:
-                        return [
-                            TextContent(
-                                type="text",
-                                text=f"Error opening file: {e}",
-                            )
-                        ]
-
-                # Ensure all workspace files are opened (for cross-file analysis)
-                await self._ensure_files_opened(client, workspace)
-
-                # Convert 1-indexed line to 0-indexed for LSP
-                lsp_line = line - 1
-
-                # Get hover info
-                hover_result = await client.hover(uri, lsp_line, character)
-
-                if not hover_result:
-                    return [
-                        TextContent(
-                            type="text",
-                            text=f"No hover information at {path.name}:{line}:{character}",
-                        )
-                    ]
-
-                # Format the hover result
-                formatted = self._format_hover(hover_result, path.name, line, character)
-
-                return [
-                    TextContent(
-                        type="text",
-                        text=formatted,
-                    )
-                ]
-
-            elif name == "get_definition":
-                workspace = arguments.get("workspace")
-                file_path = arguments.get("file_path")
-                line = arguments.get("line")
-                character = arguments.get("character")
-
-                if not all([workspace, file_path, line is not None, character is not None]):
-                    return [
-                        TextContent(
-                            type="text",
-                            text="Error: workspace, file_path, line, and character are required",
-                        )
-                    ]
-
-                # Auto-detect on first call if no workspaces
-                if not self.lsp_clients:
-                    logger.info("No workspaces connected, attempting auto-detection...")
-                    await self.auto_detect_workspace()
-
-                if workspace not in self.lsp_clients:
-                    return [
-                        TextContent(
-                            type="text",
-                            text=f"Error: Unknown workspace '{workspace}'. Available: {list(self.lsp_clients.keys())}",
-                        )
-                    ]
-
-                client = self.lsp_clients[workspace]
-
-                # Ensure file is opened in LSP
-                path = Path(file_path).resolve()
-                uri = path.as_uri()
-
-                if workspace not in self.opened_files:
-                    self.opened_files[workspace] = set()
-
-                if uri not in self.opened_files[workspace]:
-                    try:
-                        content = path.read_text()
-                        await client.did_open(uri, "scala", content)
-                        self.opened_files[workspace].add(uri)
-                        logger.info(f"Opened file for definition: {path.name}")
-                        # Give Metals a moment to analyze the file
-                        await asyncio.sleep(2)
-                    except Exception as e:
-                        return [
-                            TextContent(
-                                type="text",
-                                text=f"Error opening file: {e}",
-                            )
-                        ]
-
-                # Ensure all workspace files are opened (for cross-file analysis)
-                await self._ensure_files_opened(client, workspace)
-
-                # Convert 1-indexed line to 0-indexed for LSP
-                lsp_line = line - 1
-
-                # Get definition
-                definition_result = await client.definition(uri, lsp_line, character)
-
-                if not definition_result:
-                    return [
-                        TextContent(
-                            type="text",
-                            text=f"No definition found at {path.name}:{line}:{character}",
-                        )
-                    ]
-
-                # Format the definition result
-                formatted = self._format_definition(definition_result, path.name, line, character)
-
-                return [
-                    TextContent(
-                        type="text",
-                        text=formatted,
-                    )
-                ]
-
-            return [TextContent(type="text", text=f"Unknown tool: {name}")]
+            handler = self._tool_handlers.get(name)
+            if handler is None:
+                return [TextContent(type="text", text=f"Unknown tool: {name}")]
+            return await handler(arguments)
 
         @self.server.list_prompts()
         async def list_prompts() -> List[Prompt]:
@@ -638,9 +524,7 @@ class LSPBridgeServer:
                         ]
                     )
 
-                client = self.lsp_clients[workspace]
-                diagnostics = client.get_diagnostics()
-                formatted = self._format_diagnostics(diagnostics)
+                formatted_text = self._diagnostics_document(workspace)
 
                 prompt_text = f"""Analyze the following compilation diagnostics and provide:
 1. A summary of all errors and warnings
@@ -649,7 +533,7 @@ class LSPBridgeServer:
 4. Priority order for fixing issues
 
 Diagnostics:
-{json.dumps(formatted, indent=2)}
+{formatted_text}
 """
 
                 return GetPromptResult(
@@ -663,22 +547,321 @@ Diagnostics:
 
             raise ValueError(f"Unknown prompt: {name}")
 
+    async def _tool_list_workspaces(self, arguments: Dict[str, Any]) -> List[TextContent]:
+        """List connected workspaces, connecting or auto-detecting one if needed."""
+        workspace_root = arguments.get("workspace_root")
+
+        # If workspace_root provided, connect to it
+        if workspace_root:
+            error = await self._ensure_workspace_connected("metals", workspace_root)
+            if error:
+                return [TextContent(type="text", text=error)]
+        # Otherwise auto-detect on first call if no workspaces
+        elif not self.lsp_clients:
+            logger.info("No workspaces connected, attempting auto-detection...")
+            await self.auto_detect_workspace()
+
+        logger.info(f"Current lsp_clients: {self.lsp_clients}")
+        workspaces = list(self.lsp_clients.keys())
+        logger.info(f"Returning workspaces: {workspaces}")
+        return [
+            TextContent(
+                type="text",
+                text=_dumps(
+                    {
+                        "workspaces": workspaces,
+                        "count": len(workspaces),
+                    }
+                ),
+            )
+        ]
+
+    async def _tool_get_diagnostics(self, arguments: Dict[str, Any]) -> List[TextContent]:
+        """Compile the workspace and return its diagnostics."""
+        workspace = arguments.get("workspace")
+        file_path = arguments.get("file_path")
+        workspace_root = arguments.get("workspace_root")
+
+        # Ensure workspace is connected (lazy connect if workspace_root provided)
+        error = await self._ensure_workspace_connected(workspace, workspace_root)
+        if error:
+            return [TextContent(type="text", text=error)]
+
+        client = self.lsp_clients[workspace]
+
+        # Open all Scala files in workspace if not already opened
+        await self._ensure_files_opened(client, workspace)
+
+        # Nothing changed since the last answer: skip compile and the wait
+        if (
+            not client.dirty_since_compile
+            and client.diagnostics_version == self._last_returned_version.get(workspace)
+            and time.monotonic() - self._last_compile_at.get(workspace, 0.0)
+            < _COMPILE_REUSE_SECONDS
+        ):
+            logger.info("No changes since last compile, returning cached diagnostics")
+            return self._diagnostics_content(workspace, file_path)
+
+        # Trigger Metals to compile the workspace
+        client.diagnostics_event.clear()
+        await self._trigger_compile(client, workspace)
+        await self._wait_for_diagnostics(client)
+
+        self._last_returned_version[workspace] = client.diagnostics_version
+        return self._diagnostics_content(workspace, file_path)
+
+    async def _tool_ensure_compiled_and_get_diagnostics(
+        self, arguments: Dict[str, Any]
+    ) -> List[TextContent]:
+        """Open files and compile concurrently, then return diagnostics."""
+        workspace = arguments.get("workspace")
+        file_path = arguments.get("file_path")
+        workspace_root = arguments.get("workspace_root")
+
+        error = await self._ensure_workspace_connected(workspace, workspace_root)
+        if error:
+            return [TextContent(type="text", text=error)]
+
+        client = self.lsp_clients[workspace]
+
+        # Open files and compile concurrently, then wait once for results
+        client.diagnostics_event.clear()
+        await asyncio.gather(
+            self._ensure_files_opened(client, workspace),
+            self._trigger_compile(client, workspace),
+        )
+        await self._wait_for_diagnostics(client)
+
+        return self._diagnostics_content(workspace, file_path)
+
+    async def _tool_trigger_compilation(self, arguments: Dict[str, Any]) -> List[TextContent]:
+        """Trigger compilation in the LSP server."""
+        workspace = arguments.get("workspace")
+        workspace_root = arguments.get("workspace_root")
+
+        # Ensure workspace is connected (lazy connect if workspace_root provided)
+        error = await self._ensure_workspace_connected(workspace, workspace_root)
+        if error:
+            return [TextContent(type="text", text=error)]
+
+        client = self.lsp_clients[workspace]
+
+        try:
+            # Metals-specific: trigger compilation
+            if workspace == "metals":
+                result = await client.execute_command("metals.compile-cascade")
+                return [
+                    TextContent(
+                        type="text",
+                        text=f"Compilation triggered. Result: {_dumps(result)}",
+                    )
+                ]
+            else:
+                return [
+                    TextContent(
+                        type="text",
+                        text=f"Compilation trigger not yet implemented for {workspace}",
+                    )
+                ]
+        except Exception as e:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"Error triggering compilation: {str(e)}",
+                )
+            ]
+
+    async def _tool_get_status(self, arguments: Dict[str, Any]) -> List[TextContent]:
+        """Report client state and diagnostic counts."""
+        workspace = arguments.get("workspace")
+
+        if workspace:
+            if workspace not in self.lsp_clients:
+                return [
+                    TextContent(
+                        type="text",
+                        text=f"Error: Unknown workspace '{workspace}'",
+                    )
+                ]
+
+            client = self.lsp_clients[workspace]
+            status = {
+                "workspace": workspace,
+                **self._client_status(client),
+            }
+        else:
+            # All workspaces
+            status = {}
+            for ws_name, client in tuple(self.lsp_clients.items()):
+                status[ws_name] = self._client_status(client)
+
+        return [
+            TextContent(
+                type="text",
+                text=_dumps(status),
+            )
+        ]
+
+    async def _tool_get_hover(self, arguments: Dict[str, Any]) -> List[TextContent]:
+        """Return hover information for a symbol."""
+        workspace = arguments.get("workspace")
+        file_path = arguments.get("file_path")
+        line = arguments.get("line")
+        character = arguments.get("character")
+
+        if not all([workspace, file_path, line is not None, character is not None]):
+            return [
+                TextContent(
+                    type="text",
+                    text="Error: workspace, file_path, line, and character are required",
+                )
+            ]
+
+        # Auto-detect on first call if no workspaces
+        if not self.lsp_clients:
+            logger.info("No workspaces connected, attempting auto-detection...")
+            await self.auto_detect_workspace()
+
+        if workspace not in self.lsp_clients:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"Error: Unknown workspace '{workspace}'. Available: {list(self.lsp_clients.keys())}",
+                )
+            ]
+
+        client = self.lsp_clients[workspace]
+
+        # Ensure file is opened in LSP
+        path = Path(file_path).resolve()
+        uri = path.as_uri()
+
+        try:
+            if await self._ensure_open(workspace, uri, path):
+                logger.info(f"Opened file for hover: {path.name}")
+                # Give Metals up to 2s to analyze the file
+                await client.wait_for_file_ready(uri, timeout=2.0)
+        except Exception as e:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"Error opening file: {e}",
+                )
+            ]
+
+        # Ensure all workspace files are opened (for cross-file analysis)
+        await self._ensure_files_opened(client, workspace)
+
+        # Convert 1-indexed line to 0-indexed for LSP
+        lsp_line = line - 1
+
+        # Get hover info
+        hover_result = await client.hover(uri, lsp_line, character)
+
+        if not hover_result:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"No hover information at {path.name}:{line}:{character}",
+                )
+            ]
+
+        # Format the hover result
+        formatted = self._format_hover(hover_result, path.name, line, character)
+
+        return [
+            TextContent(
+                type="text",
+                text=formatted,
+            )
+        ]
+
+    async def _tool_get_definition(self, arguments: Dict[str, Any]) -> List[TextContent]:
+        """Return the definition location(s) of a symbol."""
+        workspace = arguments.get("workspace")
+        file_path = arguments.get("file_path")
+        line = arguments.get("line")
+        character = arguments.get("character")
+
+        if not all([workspace, file_path, line is not None, character is not None]):
+            return [
+                TextContent(
+                    type="text",
+                    text="Error: workspace, file_path, line, and character are required",
+                )
+            ]
+
+        # Auto-detect on first call if no workspaces
+        if not self.lsp_clients:
+            logger.info("No workspaces connected, attempting auto-detection...")
+            await self.auto_detect_workspace()
+
+        if workspace not in self.lsp_clients:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"Error: Unknown workspace '{workspace}'. Available: {list(self.lsp_clients.keys())}",
+                )
+            ]
+
+        client = self.lsp_clients[workspace]
+
+        # Ensure file is opened in LSP
+        path = Path(file_path).resolve()
+        uri = path.as_uri()
+
+        try:
+            if await self._ensure_open(workspace, uri, path):
+                logger.info(f"Opened file for definition: {path.name}")
+                # Give Metals up to 2s to analyze the file
+                await client.wait_for_file_ready(uri, timeout=2.0)
+        except Exception as e:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"Error opening file: {e}",
+                )
+            ]
+
+        # Ensure all workspace files are opened (for cross-file analysis)
+        await self._ensure_files_opened(client, workspace)
+
+        # Convert 1-indexed line to 0-indexed for LSP
+        lsp_line = line - 1
+
+        # Get definition
+        definition_result = await client.definition(uri, lsp_line, character)
+
+        if not definition_result:
+            return [
+                TextContent(
+                    type="text",
+                    text=f"No definition found at {path.name}:{line}:{character}",
+                )
+            ]
+
+        # Format the definition result
+        formatted = self._format_definition(definition_result, path.name, line, character)
+
+        return [
+            TextContent(
+                type="text",
+                text=formatted,
+            )
+        ]
+
     async def _ensure_files_opened(self, client: LSPClient, workspace: str) -> None:
         """Ensure all Scala files in the workspace are opened in the LSP server."""
         if workspace not in self.opened_files:
             self.opened_files[workspace] = set()
 
-        # Find all Scala files in the workspace
-        workspace_path = client.workspace_root
-        scala_files = list(workspace_path.glob("src/**/*.scala"))
+        scala_files = self._get_scala_files(client, workspace)
 
         # Check if we need to open any new files
-        current_file_uris = {f.resolve().as_uri() for f in scala_files}
         already_opened = self.opened_files[workspace]
-        new_files = current_file_uris - already_opened
+        new_files = [(f, uri) for f, uri in scala_files if uri not in already_opened]
 
         # Skip if no new files and we've already opened files recently
-        import time
         if not new_files and hasattr(client, '_last_files_opened'):
             if time.time() - client._last_files_opened < 30:
                 logger.debug("Files recently opened and no new files, skipping")
@@ -687,29 +870,72 @@ Diagnostics:
         if new_files:
             logger.info(f"Found {len(new_files)} new file(s) to open in Metals")
 
-        for scala_file in scala_files:
-            file_uri = scala_file.resolve().as_uri()
+        semaphore = asyncio.Semaphore(_OPEN_CONCURRENCY)
 
-            # Skip if already opened
-            if file_uri in self.opened_files[workspace]:
-                continue
+        async def open_file(scala_file: Path, file_uri: str) -> None:
+            async with semaphore:
+                try:
+                    if await self._ensure_open(workspace, file_uri, scala_file):
+                        logger.info(f"Opened file in Metals: {scala_file.name}")
+                except Exception as e:
+                    logger.error(f"Failed to open {scala_file}: {e}")
 
-            try:
-                # Read file content
-                with open(scala_file, 'r') as f:
-                    content = f.read()
-
-                # Open the file in Metals
-                await client.did_open(file_uri, "scala", content)
-                self.opened_files[workspace].add(file_uri)
-                logger.info(f"Opened file in Metals: {scala_file.name}")
-            except Exception as e:
-                logger.error(f"Failed to open {scala_file}: {e}")
+        await asyncio.gather(*(open_file(f, uri) for f, uri in new_files))
 
         # Mark files as opened
-        import time
         client._last_files_opened = time.time()
 
+    async def _ensure_open(
+        self,
+        workspace: str,
+        uri: str,
+        path: Optional[Path] = None,
+        content: Optional[str] = None,
+        language_id: str = "scala",
+    ) -> bool:
+        """Open a document in the workspace's LSP server unless already open.
+
+        A URI only counts as open once its didOpen has been sent; concurrent
+        callers wait for an in-flight open instead. Returns True if the
+        document was opened by this call.
+        """
+        opened = self.opened_files.setdefault(workspace, set())
+        while uri not in opened:
+            pending = self._opening.get(uri)
+            if pending is None:
+                break
+            # Re-check afterwards: if that open failed, try it ourselves
+            await asyncio.shield(pending)
+        else:
+            return False
+
+        pending = self._opening[uri] = asyncio.get_running_loop().create_future()
+        try:
+            if content is None:
+                if path is None:
+                    path = Path(_uri_to_path(uri))
+                content = await asyncio.to_thread(path.read_text)
+            await self.lsp_clients[workspace].did_open(uri, language_id, content)
+            opened.add(uri)
+        finally:
+            del self._opening[uri]
+            pending.set_result(None)
+        return True
+
+    def _get_scala_files(self, client: LSPClient, workspace: str) -> List[Tuple[Path, str]]:
+        """Return cached (path, uri) pairs for the workspace's Scala sources."""
+        now = time.monotonic()
+        scala_files = self._workspace_scala_files.get(workspace)
+        if scala_files is None or now - self._scala_files_scanned_at[workspace] > _SCALA_FILES_TTL:
+            scala_files = []
+            # Resolve the source root once rather than every file beneath it
+            for path in _walk_scala(os.path.realpath(client.workspace_root / "src")):
+                f = Path(path)
+                scala_files.append((f, f.as_uri()))
+            self._workspace_scala_files[workspace] = scala_files
+            self._scala_files_scanned_at[workspace] = now
+        return scala_files
+
     async def _ensure_workspace_connected(
         self, workspace: str, workspace_root: Optional[str]
     ) -> Optional[str]:
@@ -736,7 +962,7 @@ Diagnostics:
         if not workspace_path.exists():
             return f"Error: workspace_root does not exist: {workspace_root}"
 
-        if not (workspace_path / "build.sbt").exists() and not (workspace_path / "build.sc").exists():
+        if not _has_build_file(str(workspace_path)):
             return f"Error: workspace_root is not a Scala project (no build.sbt or build.sc): {workspace_root}"
 
         # Connect to the workspace
@@ -804,7 +1030,7 @@ Diagnostics:
                 range_info = loc.get("range", {})
 
             # Convert URI to file path
-            file_path = uri.replace("file://", "")
+            file_path = _uri_to_path(uri)
             file_name = Path(file_path).name
 
             # Get line number (convert from 0-indexed to 1-indexed)
@@ -832,65 +1058,149 @@ Diagnostics:
 
         return result
 
+    def _client_status(self, client: LSPClient) -> Dict[str, Any]:
+        """Summarize a client's state from its running diagnostic tallies."""
+        return {
+            "initialized": client.initialized,
+            "files_with_diagnostics": len(client.diagnostics),
+            "total_errors": client.error_count,
+            "total_warnings": client.warning_count,
+        }
+
+    async def _trigger_compile(self, client: LSPClient, workspace: str) -> None:
+        """Ask the LSP server to compile the workspace, logging any failure."""
+        client.mark_compiled()
+        self._last_compile_at[workspace] = time.monotonic()
+        try:
+            if workspace == "metals":
+                logger.info("Triggering Metals compilation...")
+                await client.execute_command("metals.compile-cascade")
+                logger.info("Compilation triggered, waiting for diagnostics...")
+        except Exception as e:
+            logger.warning(f"Failed to trigger compilation: {e}")
+
+    async def _wait_for_diagnostics(self, client: LSPClient) -> None:
+        """Wait for diagnostics to be published and settle, up to 8 seconds."""
+        # Metals may need time to connect to Bloop and analyze files on the first call
+        try:
+            await asyncio.wait_for(
+                client.wait_for_diagnostics_quiescence(idle_ms=500), timeout=8.0
+            )
+        except asyncio.TimeoutError:
+            pass
+
+    def _diagnostics_content(
+        self, workspace: str, file_path: Optional[str]
+    ) -> List[TextContent]:
+        """Return diagnostics for one file, or the whole workspace, as tool output."""
+        if file_path:
+            file_uri = Path(file_path).resolve().as_uri()
+            diagnostics = self.lsp_clients[workspace].get_diagnostics(file_uri)
+            return [TextContent(type="text", text=_dumps(self._format_diagnostics(diagnostics)))]
+        return [TextContent(type="text", text=chunk) for chunk in self._get_formatted(workspace)[1]]
+
+    def _diagnostics_document(self, workspace: str) -> str:
+        """Return all of a workspace's diagnostics as a single JSON document."""
+        formatted, chunks = self._get_formatted(workspace)
+        return chunks[0] if len(chunks) == 1 else _dumps(formatted)
+
+    def _get_formatted(self, workspace: str) -> Tuple[Dict[str, Any], List[str]]:
+        """Return formatted and serialized diagnostics for a whole workspace.
+
+        Large results are serialized as a summary chunk followed by one chunk
+        per file, so no single huge string is built. Results are reused until
+        the client receives new diagnostics.
+        """
+        client = self.lsp_clients[workspace]
+        cached = self._format_cache.get(workspace)
+        if cached and cached[0] == client.diagnostics_version:
+            return cached[1], cached[2]
+
+        formatted = self._format_diagnostics(client.get_diagnostics())
+        by_file = formatted["by_file"]
+        if len(by_file) > _CHUNK_FILES_THRESHOLD:
+            chunks = [_dumps({"summary": formatted["summary"]})]
+            chunks.extend(_dumps({path: diags}) for path, diags in by_file.items())
+        else:
+            chunks = [_dumps(formatted)]
+        self._format_cache[workspace] = (client.diagnostics_version, formatted, chunks)
+        return formatted, chunks
+
     def _format_diagnostics(
         self, diagnostics: Dict[str, List[Dict[str, Any]]]
     ) -> Dict[str, Any]:
         """Format diagnostics for readable output."""
-        formatted = {
-            "summary": {
-                "total_files": len(diagnostics),
-                "total_diagnostics": sum(len(diags) for diags in diagnostics.values()),
-                "errors": 0,
-                "warnings": 0,
-                "info": 0,
-            },
-            "by_file": {},
-        }
+        # Hot loop: keep counters and lookups in locals
+        sev_names = _SEV_NAMES
+        errors = warnings = info = 0
+        by_file: Dict[str, List[FormattedDiag]] = {}
 
         for file_uri, diags in diagnostics.items():
             if not diags:
                 continue
 
-            file_path = file_uri.replace("file://", "")
-            formatted_diags = []
+            formatted_diags: List[FormattedDiag] = []
+            append = formatted_diags.append
 
             for diag in diags:
                 severity = diag.get("severity", 3)
-                severity_name = {1: "ERROR", 2: "WARNING", 3: "INFO", 4: "HINT"}.get(
-                    severity, "UNKNOWN"
-                )
 
                 if severity == 1:
-                    formatted["summary"]["errors"] += 1
+                    errors += 1
                 elif severity == 2:
-                    formatted["summary"]["warnings"] += 1
+                    warnings += 1
                 else:
-                    formatted["summary"]["info"] += 1
-
-                range_info = diag.get("range", {})
-                start = range_info.get("start", {})
-                line = start.get("line", 0) + 1  # LSP is 0-indexed
-                character = start.get("character", 0)
-
-                formatted_diags.append(
-                    {
-                        "severity": severity_name,
-                        "line": line,
-                        "character": character,
-                        "message": diag.get("message", ""),
-                        "source": diag.get("source", ""),
-                        "code": diag.get("code", ""),
-                    }
+                    info += 1
+
+                start = diag.get("range", {}).get("start", {})
+                append(
+                    FormattedDiag(
+                        sev_names.get(severity, "UNKNOWN"),
+                        start.get("line", 0) + 1,  # LSP is 0-indexed
+                        start.get("character", 0),
+                        diag.get("message", ""),
+                        diag.get("source", ""),
+                        diag.get("code", ""),
+                    )
                 )
 
-            formatted["by_file"][file_path] = formatted_diags
+            by_file[_uri_to_path(file_uri)] = formatted_diags
 
-        return formatted
+        return {
+            "summary": {
+                "total_files": len(diagnostics),
+                "total_diagnostics": sum(len(diags) for diags in diagnostics.values()),
+                "errors": errors,
+                "warnings": warnings,
+                "info": info,
+            },
+            "by_file": by_file,
+        }
 
     async def start_lsp_client(
         self, workspace_name: str, workspace_root: str, command: List[str]
     ) -> None:
         """Start an LSP client for a workspace."""
+        # Serialize starts per workspace so concurrent callers can't spawn it twice,
+        # while different workspaces start in parallel
+        async with self._start_locks.setdefault(workspace_name, asyncio.Lock()):
+            if workspace_name in self.lsp_clients:
+                logger.info(f"LSP client {workspace_name} already running")
+                return
+            client = await self._start_lsp_client(workspace_name, workspace_root, command)
+            self.lsp_clients[workspace_name] = client
+            node = self._workspace_trie
+            for part in client.workspace_root.parts:
+                node = node.setdefault(part, {})
+            node[None] = workspace_name
+            self._scala_root_cache.clear()
+            self._resolve_cache.clear()
+        logger.info(f"LSP client {workspace_name} started successfully")
+
+    async def _start_lsp_client(
+        self, workspace_name: str, workspace_root: str, command: List[str]
+    ) -> LSPClient:
+        """Configure the build if needed and launch the LSP server process."""
         logger.info(
             f"Starting LSP client for {workspace_name} at {workspace_root}"
         )
@@ -915,17 +1225,23 @@ Diagnostics:
                 for attempt in range(max_retries):
                     try:
                         logger.info(f"Running sbt bloopInstall (attempt {attempt + 1}/{max_retries})...")
-                        result = subprocess.run(
-                            ["sbt", "bloopInstall"],
+                        proc = await asyncio.create_subprocess_exec(
+                            "sbt",
+                            "bloopInstall",
                             cwd=workspace_root,
-                            capture_output=True,
-                            text=True,
-                            timeout=60
+                            stdout=asyncio.subprocess.PIPE,
+                            stderr=asyncio.subprocess.PIPE,
                         )
-                        if result.returncode == 0 or bloop_dir.exists():
+                        try:
+                            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=60)
+                        except asyncio.TimeoutError:
+                            proc.kill()
+                            await proc.wait()
+                            raise
+                        if proc.returncode == 0 or bloop_dir.exists():
                             logger.info("Bloop configured successfully")
                             break
-                        elif "SIGSEGV" in result.stderr or result.returncode == 134:
+                        elif b"SIGSEGV" in stderr or proc.returncode == 134:
                             logger.warning(f"JVM crash detected, retrying...")
                             await asyncio.sleep(2)
                     except Exception as e:
@@ -937,14 +1253,23 @@ Diagnostics:
 
         client = LSPClient(workspace_root)
         await client.start(command)
-
-        self.lsp_clients[workspace_name] = client
-        logger.info(f"LSP client {workspace_name} started successfully")
+        return client
 
     async def auto_detect_workspace(self) -> None:
         """Auto-detect workspace and start appropriate LSP servers."""
-        import os
+        # Concurrent callers wait for one scan, then see its timestamp and skip.
+        # Back off after a recent scan rather than re-probing the home directory
+        async with self._autodetect_lock:
+            if time.monotonic() - self._autodetect_attempted_at < _AUTODETECT_BACKOFF:
+                logger.debug("Auto-detection ran recently, skipping")
+                return
+            try:
+                await self._auto_detect_workspace()
+            finally:
+                self._autodetect_attempted_at = time.monotonic()
 
+    async def _auto_detect_workspace(self) -> None:
+        """Probe known locations for a Scala project and start Metals for it."""
         # Check multiple locations for Scala projects
         check_paths = []
 
@@ -966,59 +1291,37 @@ Diagnostics:
             home,
         ]
 
-        for loc in common_locations:
-            if loc.exists():
-                check_paths.append(loc.resolve())
+        # Missing locations need no exists() probe: scanning them yields nothing
+        check_paths.extend(loc.resolve() for loc in common_locations)
+        check_paths = list(dict.fromkeys(check_paths))
 
         logger.info(f"Auto-detecting workspace, checking paths: {check_paths}")
 
-        # Find and start all Scala projects
-        scala_projects_found = []
+        # Probe all candidates concurrently; the first in order that hits wins
+        results = await asyncio.gather(*(self._probe_cached(p) for p in check_paths))
+        project = next((r for r in results if r), None)
 
-        for workspace_path in check_paths:
-            if not workspace_path.exists():
-                continue
-
-            # Check direct path
-            if (workspace_path / "build.sbt").exists() or (workspace_path / "build.sc").exists():
-                if str(workspace_path) not in scala_projects_found:
-                    scala_projects_found.append(str(workspace_path))
-                    logger.info(f"Found Scala project at {workspace_path}")
-
-                    # Start Metals for this workspace
-                    await self.start_lsp_client(
-                        "metals",
-                        str(workspace_path),
-                        ["metals"]
-                    )
-                    logger.info(f"Started Metals for {workspace_path}")
-                    break  # Start only the first found project
-
-            # Also check subdirectories (one level deep)
-            if workspace_path.is_dir():
-                for subdir in workspace_path.iterdir():
-                    if subdir.is_dir() and not subdir.name.startswith('.'):
-                        if (subdir / "build.sbt").exists() or (subdir / "build.sc").exists():
-                            if str(subdir) not in scala_projects_found:
-                                scala_projects_found.append(str(subdir))
-                                logger.info(f"Found Scala project at {subdir}")
-
-                                # Start Metals for this workspace
-                                await self.start_lsp_client(
-                                    "metals",
-                                    str(subdir),
-                                    ["metals"]
-                                )
-                                logger.info(f"Started Metals for {subdir}")
-                                break  # Start only the first found project
-
-                if scala_projects_found:
-                    break
-
-        if not scala_projects_found:
+        if project is None:
             logger.info("No Scala projects found during auto-detection")
+            return
+
+        logger.info(f"Found Scala project at {project}")
+        # Start Metals for this workspace (only the first found project)
+        await self.start_lsp_client("metals", project, ["metals"])
+        logger.info(f"Started Metals for {project}")
+
+    async def _probe_cached(self, path: Path) -> Optional[str]:
+        """Probe a candidate Scala root, reusing results (including misses) for a while."""
+        key = str(path)
+        now = time.monotonic()
+        cached = self._scala_root_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        result = await _probe_scala_root(path)
+        self._scala_root_cache[key] = (now + _SCALA_ROOT_TTL, result)
+        return result
 
-    async def load_config(self, config_path: str) -> None:
+    async def load_config_path(self, config_path: str) -> None:
         """Load configuration from file."""
         config_file = Path(config_path)
         if not config_file.exists():
@@ -1026,111 +1329,349 @@ Diagnostics:
             return
 
         with open(config_file) as f:
-            self.config = json.load(f)
+            config = json.load(f)
 
-        logger.info(f"Loaded config: {self.config}")
+        await self.apply_config(config)
 
-        # Start configured LSP servers
-        for server_config in self.config.get("servers", []):
-            workspace_name = server_config["name"]
-            workspace_root = server_config["workspace_root"]
-            command = server_config["command"]
+    async def apply_config(self, config: Dict[str, Any]) -> None:
+        """Apply an in-memory configuration, starting its LSP servers."""
+        self.config = config
+        logger.info(f"Loaded config: {self.config}")
 
-            await self.start_lsp_client(workspace_name, workspace_root, command)
+        # Start configured LSP servers concurrently; one failure doesn't stop the rest
+        servers = self.config.get("servers", [])
+        results = await asyncio.gather(
+            *(
+                self.start_lsp_client(s["name"], s["workspace_root"], s["command"])
+                for s in servers
+            ),
+            return_exceptions=True,
+        )
+        for server_config, result in zip(servers, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to start LSP client {server_config.get('name')}: {result}")
 
     async def _watch_notify_file(self) -> None:
         """Watch for file change notifications from hooks."""
         notify_file = Path("/tmp/lsp-bridge-notify.txt")
-        last_mtime = 0.0
+        if Inotify is not None:
+            try:
+                inotify = Inotify()
+            except OSError as e:
+                logger.warning(f"inotify unavailable, polling notify file: {e}")
+            else:
+                with inotify:
+                    await self._inotify_notify_file(inotify, notify_file)
+                return
+        await self._poll_notify_file(notify_file)
+
+    async def _inotify_notify_file(self, inotify: "Inotify", notify_file: Path) -> None:
+        """Handle hook notifications as the kernel reports writes to the notify file."""
+        while True:
+            try:
+                # The watch is on the file itself, so it must exist; re-arm if removed
+                notify_file.touch(exist_ok=True)
+                inotify.add_watch(notify_file, Mask.CLOSE_WRITE)
+                async for event in inotify:
+                    if event.mask & Mask.IGNORED:
+                        break
+                    await self._read_notify_file(notify_file)
+            except Exception as e:
+                logger.error(f"Error in notify watcher: {e}")
+                await asyncio.sleep(1)
+
+    async def _poll_notify_file(self, notify_file: Path) -> None:
+        """Poll the notify file's mtime for hook notifications."""
+        # One os.stat per tick on a plain string, rather than Path.exists() + Path.stat()
+        notify_file_str = str(notify_file)
+        last_mtime = 0
 
         while True:
             try:
-                if notify_file.exists():
-                    mtime = notify_file.stat().st_mtime
-                    if mtime > last_mtime:
-                        last_mtime = mtime
-                        file_path = notify_file.read_text().strip()
-                        if file_path and file_path.endswith(".scala"):
-                            logger.info(f"Hook notification for: {file_path}")
-                            await self._notify_file_changed(file_path)
+                try:
+                    mtime = os.stat(notify_file_str).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = 0
+                if mtime > last_mtime:
+                    last_mtime = mtime
+                    await self._read_notify_file(notify_file)
                 await asyncio.sleep(0.5)  # Check every 500ms
             except Exception as e:
                 logger.error(f"Error in notify watcher: {e}")
                 await asyncio.sleep(1)
 
+    async def _read_notify_file(self, notify_file: Path) -> None:
+        """Queue the source file path written to the notify file by a hook."""
+        file_path = notify_file.read_text().strip()
+        if file_path.endswith(_WATCHED_EXTS):
+            logger.info(f"Hook notification for: {file_path}")
+            self._schedule_notification(file_path)
+
+    def _schedule_notification(self, file_path: str) -> None:
+        """Debounce notifications per file so a burst results in one didChange."""
+        pending = self._pending_notifications.pop(file_path, None)
+        if pending is not None:
+            pending.cancel()
+        self._pending_notifications[file_path] = asyncio.get_running_loop().call_later(
+            _NOTIFY_DEBOUNCE, self._dispatch_notification, file_path
+        )
+
+    def _dispatch_notification(self, file_path: str) -> None:
+        """Start handling a file's notification once its debounce window has passed."""
+        self._pending_notifications.pop(file_path, None)
+        task = asyncio.create_task(self._notify_file_changed(file_path))
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
     async def _notify_file_changed(self, file_path: str) -> None:
-        """Send didChange notification to Metals for a file."""
+        """Send didChange (or didOpen, if not yet open) to Metals for a file."""
         try:
-            path = Path(file_path).resolve()
-            uri = path.as_uri()
-
-            # Auto-detect workspace if none connected
-            if not self.lsp_clients:
-                logger.info("No workspaces connected, auto-detecting for file change...")
-                await self.auto_detect_workspace()
-
-            # Find the appropriate client
-            for workspace, client in self.lsp_clients.items():
-                if str(path).startswith(str(client.workspace_root)):
-                    # Read the file content
-                    content = path.read_text()
-
-                    # Increment version
-                    self.file_versions[uri] = self.file_versions.get(uri, 0) + 1
-                    version = self.file_versions[uri]
-
-                    # Send didChange
-                    await client.did_change(uri, content, version)
-                    logger.info(f"Sent didChange for {path.name} (v{version})")
-
-                    # Trigger compilation
-                    if workspace == "metals":
-                        await client.execute_command("metals.compile-cascade")
-                        logger.info("Triggered compilation after file change")
-                    break
+            resolved = self._resolve_notified_file(file_path)
+            if resolved is None:
+                # Auto-detect workspace if none connected
+                if not self.lsp_clients:
+                    logger.info("No workspaces connected, auto-detecting for file change...")
+                    await self.auto_detect_workspace()
+                resolved = self._resolve_notified_file(file_path)
+                if resolved is None:
+                    logger.warning(f"No workspace found for {file_path}")
+                    return
+
+            path, uri, workspace = resolved
+            client = self.lsp_clients[workspace]
+
+            # Read the file content off the event loop
+            async with self._read_sem:
+                content = await asyncio.to_thread(path.read_text)
+            # Compare content, not mtime: coarse timestamps and mtime-preserving
+            # tools can leave a real edit with the previous mtime
+            content_hash = hash(content)
+            if self._sent_hashes.get(uri) == content_hash:
+                logger.debug(f"{path.name} unchanged since last notification, skipping")
+                return
+
+            # A Scala file we haven't opened may be new; rescan sources next time
+            opened = self.opened_files.setdefault(workspace, set())
+            if path.suffix == ".scala" and uri not in opened and uri not in self._opening:
+                self._workspace_scala_files.pop(workspace, None)
+
+            # Open it with this content, or wait for an open already in flight;
+            # either way a didChange only follows the server seeing didOpen
+            versions = self.file_versions
+            sends = []
+            if await self._ensure_open(
+                workspace, uri, path, content, _LANGUAGE_IDS.get(path.suffix, "scala")
+            ):
+                versions.pop(uri, None)
+                versions[uri] = 1
+                action = f"didOpen for {path.name}"
             else:
-                logger.warning(f"No workspace found for {file_path}")
+                # Documents open at version 1; re-inserting marks the URI most
+                # recently changed
+                version = versions.pop(uri, 1) + 1
+                versions[uri] = version
+                sends.append(client.did_change(uri, content, version))
+                action = f"didChange for {path.name} (v{version})"
+            # Pipeline the compile request right behind any didChange: both are
+            # written before either awaits, so a drain doesn't delay the compile
+            if workspace == "metals":
+                sends.append(client.execute_command("metals.compile-cascade"))
+            await asyncio.gather(*sends)
+            logger.info(f"Sent {action}" + (" and compiled" if workspace == "metals" else ""))
+            # Only once sent, so a failed send is retried by the next notification
+            self._sent_hashes[uri] = content_hash
+
+            if len(versions) > _FILE_VERSIONS_SIZE:
+                await self._evict_file_version()
         except Exception as e:
             logger.error(f"Failed to notify file change: {e}")
 
+    async def _evict_file_version(self) -> None:
+        """Forget the least recently changed document, closing it if open.
+
+        Its version restarts at 1 when next opened, which the server only
+        accepts once it has seen the document closed.
+        """
+        uri, _ = self.file_versions.popitem(last=False)
+        self._sent_hashes.pop(uri, None)
+        for workspace, opened in self.opened_files.items():
+            if uri in opened:
+                opened.discard(uri)
+                client = self.lsp_clients.get(workspace)
+                if client is not None:
+                    await client.did_close(uri)
+
+    def _resolve_notified_file(self, file_path: str) -> Optional[Tuple[Path, str, str]]:
+        """Map a notified path to (resolved path, URI, owning workspace), memoized."""
+        cache = self._resolve_cache
+        entry = cache.get(file_path)
+        if entry is not None and entry[2] in self.lsp_clients:
+            cache.move_to_end(file_path)
+            return entry
+
+        path = Path(file_path).resolve()
+        workspace = self._workspace_for_path(path)
+        if workspace is None:
+            return None
+        entry = (path, path.as_uri(), workspace)
+        cache[file_path] = entry
+        if len(cache) > _RESOLVE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return entry
+
+    def _workspace_for_path(self, path: Path) -> Optional[str]:
+        """Return the most specific connected workspace containing path."""
+        node = self._workspace_trie
+        found = node.get(None)
+        for part in path.parts:
+            node = node.get(part)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found if found in self.lsp_clients else None
+
     async def run(self, config_path: Optional[str] = None) -> None:
         """Run the MCP server."""
-        # Start the notify file watcher
+        # Accept hook notifications on the Unix socket, and keep watching the
+        # notify file for hooks that write to it
+        notify_server = await self._start_notify_socket()
         self._notify_watcher_task = asyncio.create_task(self._watch_notify_file())
 
         # Load config in background (non-blocking) so MCP server starts immediately
         # This allows tools to be available right away, with LSP connecting lazily
-        if config_path:
+        if self._pending_config is not None or config_path:
             asyncio.create_task(self._load_config_background(config_path))
 
-        async with stdio_server() as (read_stream, write_stream):
-            await self.server.run(
-                read_stream,
-                write_stream,
-                self.server.create_initialization_options(),
-            )
+        try:
+            async with stdio_server(stdin=_buffered_stdin()) as (read_stream, write_stream):
+                await self.server.run(
+                    read_stream,
+                    write_stream,
+                    self.server.create_initialization_options(),
+                )
+        finally:
+            if notify_server is not None:
+                notify_server.close()
+                self._remove_notify_socket()
+
+    async def _start_notify_socket(self) -> Optional[asyncio.AbstractServer]:
+        """Listen for hook notifications on a Unix socket, one path per line."""
+        try:
+            is_socket = stat.S_ISSOCK(os.lstat(_NOTIFY_SOCKET).st_mode)
+        except FileNotFoundError:
+            is_socket = False
+        except OSError as e:
+            logger.warning(f"Cannot use notify socket {_NOTIFY_SOCKET}: {e}")
+            return None
 
-    async def _load_config_background(self, config_path: str) -> None:
+        if is_socket:
+            # Leave a live instance's socket alone; only replace one nobody accepts on
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_unix_connection(_NOTIFY_SOCKET), timeout=1.0
+                )
+            except ConnectionRefusedError:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(_NOTIFY_SOCKET)
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Cannot use notify socket {_NOTIFY_SOCKET}: {e}")
+                return None
+            else:
+                writer.close()
+                logger.warning(
+                    f"Notify socket {_NOTIFY_SOCKET} is served by another instance, "
+                    "using notify file only"
+                )
+                return None
+
+        try:
+            server = await asyncio.start_unix_server(self._on_hook_msg, path=_NOTIFY_SOCKET)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"Notify socket unavailable, using notify file only: {e}")
+            return None
+        st = os.stat(_NOTIFY_SOCKET)
+        self._notify_socket_id = (st.st_dev, st.st_ino)
+        return server
+
+    def _remove_notify_socket(self) -> None:
+        """Unlink the notify socket if the path still refers to the one we bound."""
+        try:
+            st = os.lstat(_NOTIFY_SOCKET)
+            if (st.st_dev, st.st_ino) == self._notify_socket_id:
+                os.unlink(_NOTIFY_SOCKET)
+        except OSError:
+            pass
+        self._notify_socket_id = None
+
+    async def _on_hook_msg(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Handle one hook connection on the notify socket."""
+        try:
+            async for line in reader:
+                file_path = line.decode(errors="replace").strip()
+                if file_path.endswith(_WATCHED_EXTS):
+                    logger.info(f"Hook notification for: {file_path}")
+                    self._schedule_notification(file_path)
+        except Exception as e:
+            logger.error(f"Error reading notify socket: {e}")
+        finally:
+            writer.close()
+
+    async def _load_config_background(self, config_path: Optional[str]) -> None:
         """Load config in background without blocking MCP server startup."""
         try:
             # Small delay to let MCP server fully initialize first
             await asyncio.sleep(0.5)
-            await self.load_config(config_path)
+            if self._pending_config is not None:
+                config, self._pending_config = self._pending_config, None
+                await self.apply_config(config)
+            elif config_path:
+                await self.load_config_path(config_path)
         except Exception as e:
             logger.error(f"Background config load failed: {e}")
 
     async def shutdown(self) -> None:
         """Shutdown all LSP clients."""
-        for client in self.lsp_clients.values():
-            await client.shutdown()
+        # Stop hook notifications first so none fire mid-teardown
+        task = self._notify_watcher_task
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        for pending in self._pending_notifications.values():
+            pending.cancel()
+        self._pending_notifications.clear()
+
+        self._resolve_cache.clear()
+        self._workspace_trie.clear()
+        results = await asyncio.gather(
+            *(client.shutdown() for client in tuple(self.lsp_clients.values())),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error shutting down LSP client: {result}")
+
+
+def _buffered_stdin() -> "anyio.AsyncFile[str]":
+    """Wrap stdin as UTF-8 text that reads in large chunks for the MCP transport."""
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+    # readline() pulls _CHUNK_SIZE bytes per read1() (8 KiB by default), and each
+    # read1() on an empty buffer is one read() syscall; enlarging the buffer
+    # underneath doesn't help. 1 MiB chunks cut a 1 MiB line from ~128 reads to
+    # ~16, the rest being the pipe's 64 KiB capacity
+    stdin._CHUNK_SIZE = _STDIN_CHUNK_SIZE
+    return anyio.wrap_file(stdin)
 
 
 def main():
     """Main entry point."""
-    import os
+    run = uvloop.run if uvloop is not None else asyncio.run
 
     # Check for config path from args or auto-detect
     config_path = sys.argv[1] if len(sys.argv) > 1 else None
+    server = LSPBridgeServer()
 
     # If no config, try to auto-detect Scala project
     if not config_path:
@@ -1138,14 +1679,11 @@ def main():
         workspace_path = Path(workspace).resolve()
 
         # Check if this is a Scala/sbt project
-        if (workspace_path / "build.sbt").exists() or (workspace_path / "build.sc").exists():
+        if _has_build_file(str(workspace_path)):
             logger.info(f"Auto-detected Scala project at {workspace_path}")
 
-            # Create temporary config
-            import tempfile
-            import json
-
-            temp_config = {
+            # Hand the config straight to the server; no need to round-trip it through disk
+            server._pending_config = {
                 "servers": [
                     {
                         "name": "metals",
@@ -1155,21 +1693,14 @@ def main():
                 ]
             }
 
-            # Write to temp file
-            fd, config_path = tempfile.mkstemp(suffix=".json")
-            with os.fdopen(fd, 'w') as f:
-                json.dump(temp_config, f)
-
             logger.info(f"Created auto-config for {workspace_path}")
 
-    server = LSPBridgeServer()
-
     try:
-        asyncio.run(server.run(config_path))
+        run(server.run(config_path))
     except KeyboardInterrupt:
         logger.info("Shutting down...")
     finally:
-        asyncio.run(server.shutdown())
+        run(server.shutdown())
 
 
 if __name__ == "__main__":
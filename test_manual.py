@@ -37,33 +37,37 @@ async def test_metals():
 
         # Open the Scala files so Metals analyzes them
         print("\n📂 Opening Scala files...")
+        source_dir = Path(workspace) / "src/main/scala"
+        candidates = (source_dir / "Main.scala", source_dir / "Calculator.scala")
+        exists = await asyncio.gather(*(asyncio.to_thread(f.exists) for f in candidates))
+        # (path, uri, name) for each file present, computed once up front
         scala_files = [
-            Path(workspace) / "src/main/scala/Main.scala",
-            Path(workspace) / "src/main/scala/Calculator.scala",
+            (f, f.as_uri(), f.name) for f, found in zip(candidates, exists) if found
         ]
 
-        for scala_file in scala_files:
-            if scala_file.exists():
-                print(f"   Opening {scala_file.name}...")
-                with open(scala_file) as f:
-                    content = f.read()
-                await client.did_open(
-                    scala_file.as_uri(),
-                    "scala",
-                    content
-                )
+        async def open_one(scala_file: Path, uri: str, name: str) -> None:
+            print(f"   Opening {name}...")
+            content = await asyncio.to_thread(scala_file.read_text)
+            await client.did_open(uri, "scala", content)
+
+        # Open the files concurrently rather than one at a time
+        await asyncio.gather(*(open_one(*entry) for entry in scala_files))
 
         # Trigger compilation to get diagnostics
         print("\n🔨 Triggering workspace compilation...")
+        client.diagnostics_event.clear()
         try:
             compile_result = await client.execute_command("metals.compile-cascade")
             print(f"   Compilation triggered: {compile_result}")
         except Exception as e:
             print(f"   Note: Compile command failed (this is ok): {e}")
 
-        # Wait a bit for diagnostics
-        print("\n⏳ Waiting for diagnostics (10 seconds)...")
-        await asyncio.sleep(10)
+        # Wait for diagnostics to arrive and settle, up to 10 seconds
+        print("\n⏳ Waiting for diagnostics (up to 10 seconds)...")
+        try:
+            await asyncio.wait_for(client.wait_for_diagnostics_quiescence(), timeout=10.0)
+        except asyncio.TimeoutError:
+            print("   Timed out waiting for diagnostics")
 
         diagnostics = client.get_diagnostics()
         print(f"\n📊 Diagnostics received for {len(diagnostics)} files")